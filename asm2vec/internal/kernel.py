@@ -0,0 +1,147 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Precomputed table of the reflected sigmoid 1 / (1 + exp(x)) on
+# [-_MAX_SIG_ARG, _MAX_SIG_ARG], the classic word2vec trick: beyond that range
+# the sigmoid is saturated anyway, so the compiled kernels replace a libm exp
+# per target with a clamped table lookup.
+_SIG_TABLE_SIZE = 1000
+_MAX_SIG_ARG = 6.0
+_SIG_SCALE = (_SIG_TABLE_SIZE - 1) / (2 * _MAX_SIG_ARG)
+_SIG_TABLE = (1 / (1 + np.exp(np.linspace(-_MAX_SIG_ARG, _MAX_SIG_ARG, _SIG_TABLE_SIZE)))).astype(np.float32)
+
+
+def sigmoid(scores: np.ndarray) -> np.ndarray:
+    # Computes 1 / (1 + exp(scores)) without letting exp overflow for large
+    # positive scores.
+    out = np.empty_like(scores)
+    pos = scores >= 0
+    ex = np.exp(-scores[pos])
+    out[pos] = ex / (1 + ex)
+    out[~pos] = 1 / (1 + np.exp(scores[~pos]))
+    return out
+
+
+def _inst_repr_impl(v_matrix, op_id, args_flat, begin, end, out):
+    d = v_matrix.shape[1]
+    for j in range(d):
+        out[j] = v_matrix[op_id, j]
+        out[d + j] = 0.0
+
+    n_args = end - begin
+    for q in range(n_args):
+        arg_id = args_flat[begin + q]
+        for j in range(d):
+            out[d + j] += v_matrix[arg_id, j]
+    if n_args > 0:
+        for j in range(d):
+            out[d + j] /= n_args
+
+
+def _train_sequence_impl(f_v, v_matrix, v_pred_matrix, op_ids, args_flat, args_offsets,
+                         neg_ids, neg_samples, alpha, update_vectors):
+    n = op_ids.shape[0]
+    d2 = v_pred_matrix.shape[1]
+    d = d2 // 2
+
+    prev_repr = np.empty(d2, np.float32)
+    next_repr = np.empty(d2, np.float32)
+    delta = np.empty(d2, np.float32)
+    f_grad = np.empty(d2, np.float32)
+    target_ids = np.empty(neg_samples + 1, np.int64)
+
+    neg_base = 0
+    for i in range(1, n - 1):
+        _inst_repr(v_matrix, op_ids[i - 1], args_flat, args_offsets[i - 1], args_offsets[i], prev_repr)
+        _inst_repr(v_matrix, op_ids[i + 1], args_flat, args_offsets[i + 1], args_offsets[i + 2], next_repr)
+        for j in range(d2):
+            delta[j] = (prev_repr[j] + f_v[j] + next_repr[j]) / 3
+            f_grad[j] = 0.0
+
+        n_args = args_offsets[i + 1] - args_offsets[i]
+        for t in range(n_args + 1):
+            if t == 0:
+                pos_id = op_ids[i]
+            else:
+                pos_id = args_flat[args_offsets[i] + t - 1]
+
+            # Deduplicate the targets: the positive token goes first, followed
+            # by every distinct negative sample.
+            target_ids[0] = pos_id
+            n_targets = 1
+            for q in range(neg_samples):
+                cand = neg_ids[neg_base + q]
+                seen = False
+                for r in range(n_targets):
+                    if target_ids[r] == cand:
+                        seen = True
+                        break
+                if not seen:
+                    target_ids[n_targets] = cand
+                    n_targets += 1
+            neg_base += neg_samples
+
+            for r in range(n_targets):
+                tid = target_ids[r]
+                s = 0.0
+                for j in range(d2):
+                    s += v_pred_matrix[tid, j] * delta[j]
+                idx = int((s + _MAX_SIG_ARG) * _SIG_SCALE)
+                sig = _SIG_TABLE[min(max(idx, 0), _SIG_TABLE_SIZE - 1)]
+                label = 1.0 if r == 0 else 0.0
+                g = (label - sig) * alpha
+                g3 = g / 3
+                if update_vectors:
+                    for j in range(d2):
+                        f_grad[j] += g3 * v_pred_matrix[tid, j]
+                        v_pred_matrix[tid, j] -= g * delta[j]
+                else:
+                    for j in range(d2):
+                        f_grad[j] += g3 * v_pred_matrix[tid, j]
+
+        # Apply the function gradient, and distribute it over the neighbor
+        # instructions' tokens, reading each f_grad element once per pass.
+        if update_vectors:
+            op_prev = op_ids[i - 1]
+            op_next = op_ids[i + 1]
+            for j in range(d):
+                g_op = f_grad[j]
+                f_v[j] -= g_op
+                f_v[d + j] -= f_grad[d + j]
+                v_matrix[op_prev, j] -= g_op
+                v_matrix[op_next, j] -= g_op
+
+            n_prev = args_offsets[i] - args_offsets[i - 1]
+            if n_prev > 0:
+                inv_prev = 1.0 / n_prev
+                for q in range(n_prev):
+                    arg_id = args_flat[args_offsets[i - 1] + q]
+                    for j in range(d):
+                        v_matrix[arg_id, j] -= f_grad[d + j] * inv_prev
+
+            n_next = args_offsets[i + 2] - args_offsets[i + 1]
+            if n_next > 0:
+                inv_next = 1.0 / n_next
+                for q in range(n_next):
+                    arg_id = args_flat[args_offsets[i + 1] + q]
+                    for j in range(d):
+                        v_matrix[arg_id, j] -= f_grad[d + j] * inv_next
+        else:
+            for j in range(d2):
+                f_v[j] -= f_grad[j]
+
+
+if numba is not None:
+    # nogil lets the executor threads run their sequences truly in parallel;
+    # the resulting unsynchronized (Hogwild-style) updates to the shared token
+    # matrices are acceptable for sparse SGD at small learning rates.
+    _inst_repr = numba.njit(fastmath=True, cache=True, nogil=True)(_inst_repr_impl)
+    train_sequence = numba.njit(fastmath=True, cache=True, nogil=True)(_train_sequence_impl)
+else:
+    _inst_repr = _inst_repr_impl
+    train_sequence = None
@@ -2,6 +2,8 @@ import random
 from typing import *
 import concurrent.futures
 
+import numpy as np
+
 from asm2vec.asm import Instruction
 from asm2vec.asm import BasicBlock
 from asm2vec.asm import Function
@@ -87,7 +89,9 @@ def _make_function_repo_helper(vocab: Dict[str, Token], funcs: List[Function],
 
     def func_handler(f: Function):
         with vec_funcs_atomic.lock() as vfa:
-            vfa.value().append(VectorizedFunction(make_sequential_function(f, num_of_rnd_walks)))
+            # The function vector lives in the concatenated (op, args) space,
+            # which is twice the token dimension.
+            vfa.value().append(VectorizedFunction(make_sequential_function(f, num_of_rnd_walks), dim=dim * 2))
 
         tokens = _get_function_tokens(f, dim)
         for tk in tokens:
@@ -128,5 +132,12 @@ def make_function_repo(funcs: List[Function], dim: int, num_of_rnd_walks: int, j
 def make_estimate_repo(vocabulary: Dict[str, Token], f: Function,
                        dim: int, num_of_rnd_walks: int) -> FunctionRepository:
     # Make a copy of the function list and vocabulary to avoid the change to affect the original trained repo.
-    vocab: Dict[str, Token] = dict(**vocabulary)
+    # The copy has to be deep: FunctionRepository re-points the tokens it is given at rows of its own
+    # matrices, so handing it the trained repo's Token objects would detach them from the trained matrices.
+    vocab: Dict[str, Token] = dict()
+    for (name, token) in vocabulary.items():
+        vt = token.vectorized()
+        copied = Token(VectorizedToken(name, np.array(vt.v), np.array(vt.v_pred)), token.count)
+        copied.frequency = token.frequency
+        vocab[name] = copied
     return _make_function_repo_helper(vocab, [f], dim, num_of_rnd_walks, 1)
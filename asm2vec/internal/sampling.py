@@ -1,13 +1,46 @@
 from typing import *
-import random
+
+import numpy as np
 
 T = TypeVar('T')
 
 
+def _make_alias_table(probs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Walker's alias method: O(n) setup, O(1) per draw.
+    n = len(probs)
+    scaled = probs * n
+    accept_probs = np.ones(n)
+    alias = np.zeros(n, dtype=np.int64)
+
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while len(small) > 0 and len(large) > 0:
+        s = small.pop()
+        lg = large.pop()
+        accept_probs[s] = scaled[s]
+        alias[s] = lg
+        scaled[lg] -= 1 - scaled[s]
+        if scaled[lg] < 1:
+            small.append(lg)
+        else:
+            large.append(lg)
+
+    return accept_probs, alias
+
+
 class NegativeSampler:
-    def __init__(self, distribution: List[Tuple[T, float]], alpha: float = 3 / 4):
-        self._values = list(map(lambda x: x[0], distribution))
-        self._weights = list(map(lambda x: x[1] ** alpha, distribution))
+    def __init__(self, values: List[T], frequencies: np.ndarray, alpha: float = 3 / 4):
+        self._values = values
+        weights = np.asarray(frequencies) ** alpha
+        self._accept_probs, self._alias = _make_alias_table(weights / np.sum(weights))
+
+    def values(self) -> List[T]:
+        return self._values
 
     def sample(self, k: int) -> List[T]:
-        return random.choices(self._values, self._weights, k=k)
+        return [self._values[i] for i in self.sample_batch(k)]
+
+    def sample_batch(self, n: int) -> np.ndarray:
+        slots = np.random.randint(0, len(self._values), n)
+        accepted = np.random.random(n) < self._accept_probs[slots]
+        return np.where(accepted, slots, self._alias[slots])
@@ -13,6 +13,7 @@ from asm2vec.internal.repr import VectorizedToken
 from asm2vec.internal.sampling import NegativeSampler
 from asm2vec.internal.atomic import LockContextManager
 from asm2vec.internal.atomic import Atomic
+from asm2vec.internal import kernel
 from asm2vec.logging import asm2vec_logger
 
 
@@ -48,11 +49,52 @@ class Asm2VecParams:
 
 
 class SequenceWindow:
-    def __init__(self, sequence: List[Instruction], vocabulary: Dict[str, Token]):
+    def __init__(self, sequence: List[Instruction], vocabulary: Dict[str, Token], dim: int,
+                 token_cache: Dict[int, Tuple[VectorizedToken, List[VectorizedToken]]] = None):
         self._seq = sequence
-        self._vocab = vocabulary
         self._i = 1
 
+        # Reusable buffers for the neighbor instruction representations and the
+        # joint context vector so that the hot path does not allocate per window.
+        self.prev_repr_buf = np.empty(dim * 2, dtype=np.float32)
+        self.next_repr_buf = np.empty(dim * 2, dtype=np.float32)
+        self.delta_buf = np.empty(dim * 2, dtype=np.float32)
+        self.f_grad_buf = np.empty(dim * 2, dtype=np.float32)
+        self.args_grad_buf = np.empty(dim, dtype=np.float32)
+
+        # Resolve every token once per sequence. Consecutive windows share two
+        # of their three instructions, so per-window vocabulary lookups were
+        # mostly redundant; iteration is now pure index arithmetic. The random
+        # walks of a function also share Instruction objects, so resolutions
+        # are further memoized by instruction identity in the token_cache the
+        # training context hands to all of its windows.
+        if token_cache is None:
+            token_cache = dict()
+
+        def token_lookup(ins: Instruction) -> Tuple[VectorizedToken, List[VectorizedToken]]:
+            cached = token_cache.get(id(ins))
+            if cached is None:
+                cached = (vocabulary[ins.op()].vectorized(),
+                          [vocabulary[name].vectorized() for name in ins.args()])
+                token_cache[id(ins)] = cached
+            return cached
+
+        resolved = [token_lookup(ins) for ins in sequence]
+        self._op_tokens = [op for (op, _) in resolved]
+        self._args_tokens = [args for (_, args) in resolved]
+
+        # Flat id views of the sequence for the compiled per-sequence kernel:
+        # one row index per operator, and the argument indices flattened with
+        # an offsets array marking each instruction's span.
+        self._op_ids = np.array([t.idx for t in self._op_tokens], dtype=np.int64)
+        self._args_ids = [np.array([t.idx for t in args], dtype=np.int64) for args in self._args_tokens]
+        self._args_offsets = np.zeros(len(sequence) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in self._args_ids], out=self._args_offsets[1:])
+        if len(self._args_ids) > 0:
+            self._args_flat = np.concatenate(self._args_ids)
+        else:
+            self._args_flat = np.empty(0, dtype=np.int64)
+
         self._prev_ins = None
         self._curr_ins = None
         self._next_ins = None
@@ -64,28 +106,41 @@ class SequenceWindow:
         self._next_ins_op = None
         self._next_ins_args = None
 
+        self._prev_ins_args_ids = None
+        self._next_ins_args_ids = None
+
     def move_next(self) -> bool:
         if self._i >= len(self._seq) - 1:
             return False
 
-        def token_lookup(name) -> VectorizedToken:
-            return self._vocab[name].vectorized()
+        i = self._i
+        self._prev_ins = self._seq[i - 1]
+        self._curr_ins = self._seq[i]
+        self._next_ins = self._seq[i + 1]
 
-        self._prev_ins = self._seq[self._i - 1]
-        self._curr_ins = self._seq[self._i]
-        self._next_ins = self._seq[self._i + 1]
+        self._prev_ins_op = self._op_tokens[i - 1]
+        self._prev_ins_args = self._args_tokens[i - 1]
+        self._curr_ins_op = self._op_tokens[i]
+        self._curr_ins_args = self._args_tokens[i]
+        self._next_ins_op = self._op_tokens[i + 1]
+        self._next_ins_args = self._args_tokens[i + 1]
 
-        self._prev_ins_op = token_lookup(self._prev_ins.op())
-        self._prev_ins_args = list(map(token_lookup, self._prev_ins.args()))
-        self._curr_ins_op = token_lookup(self._curr_ins.op())
-        self._curr_ins_args = list(map(token_lookup, self._curr_ins.args()))
-        self._next_ins_op = token_lookup(self._next_ins.op())
-        self._next_ins_args = list(map(token_lookup, self._next_ins.args()))
+        self._prev_ins_args_ids = self._args_ids[i - 1]
+        self._next_ins_args_ids = self._args_ids[i + 1]
 
         self._i += 1
 
         return True
 
+    def op_ids(self) -> np.ndarray:
+        return self._op_ids
+
+    def args_flat_ids(self) -> np.ndarray:
+        return self._args_flat
+
+    def args_offsets(self) -> np.ndarray:
+        return self._args_offsets
+
     def prev_ins(self) -> Instruction:
         return self._prev_ins
 
@@ -95,6 +150,9 @@ class SequenceWindow:
     def prev_ins_args(self) -> List[VectorizedToken]:
         return self._prev_ins_args
 
+    def prev_ins_args_ids(self) -> np.ndarray:
+        return self._prev_ins_args_ids
+
     def curr_ins(self) -> Instruction:
         return self._curr_ins
 
@@ -113,38 +171,24 @@ class SequenceWindow:
     def next_ins_args(self) -> List[VectorizedToken]:
         return self._next_ins_args
 
+    def next_ins_args_ids(self) -> np.ndarray:
+        return self._next_ins_args_ids
 
-class TrainingContext:
-    class Counter:
-        def __init__(self, context: 'TrainingContext', name: str, initial: int = 0):
-            self._context = context
-            self._name = name
-            self._val = initial
-
-        def val(self) -> int:
-            with self._context.lock():
-                return self._val
-
-        def inc(self) -> int:
-            with self._context.lock():
-                self._val += 1
-                return self._val
-
-        def reset(self) -> int:
-            with self._context.lock():
-                v = self._val
-                self._val = 0
-                return v
-
-    TOKENS_HANDLED_COUNTER: str = "tokens_handled"
 
+class TrainingContext:
     def __init__(self, repo: FunctionRepository, params: Asm2VecParams, is_estimating: bool = False):
         self._repo = repo
         self._params = params
         self._alpha = params.initial_alpha
-        self._sampler = NegativeSampler(list(map(lambda t: (t, t.frequency), repo.vocab().values())))
+        vocab_tokens = list(repo.vocab().values())
+        frequencies = np.array([t.frequency for t in vocab_tokens])
+        self._sampler = NegativeSampler(vocab_tokens, frequencies)
         self._is_estimating = is_estimating
-        self._counters = dict()
+        # A plain int rather than a lock-guarded counter object: the value is
+        # advisory (it only drives the learning rate schedule) so racy updates
+        # from concurrent workers are acceptable.
+        self.tokens_handled: int = 0
+        self._ins_token_cache: Dict[int, Tuple[VectorizedToken, List[VectorizedToken]]] = dict()
         self._lock = threading.Lock()
 
     def repo(self) -> FunctionRepository:
@@ -171,105 +215,131 @@ class TrainingContext:
         return self._is_estimating
 
     def create_sequence_window(self, seq: List[Instruction]) -> SequenceWindow:
-        return SequenceWindow(seq, self._repo.vocab())
-
-    def get_counter(self, name: str) -> Counter:
-        with self.lock():
-            return self._counters.get(name)
-
-    def add_counter(self, name: str, initial: int = 0) -> Counter:
-        with self.lock():
-            c = self.__class__.Counter(self, name, initial)
-            self._counters[name] = c
-            return c
-
-
-def _sigmoid(x: float) -> float:
-    return 1 / (1 + np.exp(x))
+        return SequenceWindow(seq, self._repo.vocab(), self._params.d, self._ins_token_cache)
 
 
-def _identity(cond: bool) -> int:
-    return 1 if cond else 0
+def _get_inst_repr(v_matrix: np.ndarray, op_id: int, args_ids: np.ndarray, out: np.ndarray) -> np.ndarray:
+    d = v_matrix.shape[1]
+    out[:d] = v_matrix[op_id]
 
-
-def _dot_sigmoid(lhs: np.ndarray, rhs: np.ndarray) -> float:
-    # noinspection PyTypeChecker
-    return _sigmoid(np.dot(lhs, rhs))
-
-
-def _get_inst_repr(op: VectorizedToken, args: List[VectorizedToken]) -> np.ndarray:
-    if len(args) == 0:
-        arg_vec = np.zeros(len(op.v))
+    if len(args_ids) > 0:
+        np.mean(v_matrix[args_ids], axis=0, out=out[d:])
     else:
-        arg_vec = np.average(list(map(lambda tk: tk.v, args)), axis=0)
-    return np.hstack((op.v, arg_vec))
-
-
-def _train_vectorized(wnd: SequenceWindow, f: VectorizedFunction, context: TrainingContext) -> None:
-    ct_prev = _get_inst_repr(wnd.prev_ins_op(), wnd.prev_ins_args())
-    ct_next = _get_inst_repr(wnd.next_ins_op(), wnd.next_ins_args())
-    delta = np.average([ct_prev, f.v, ct_next], axis=0)
+        out[d:] = 0
+
+    return out
+
+
+def _train_vectorized(wnd: SequenceWindow, f: VectorizedFunction, context: TrainingContext,
+                      neg_ids: np.ndarray) -> None:
+    # Hoist every per-iteration context lookup into a local: each of these is a
+    # method call plus an attribute chain that the token loop would otherwise
+    # repeat millions of times.
+    params = context.params()
+    neg_samples = params.neg_samples
+    alpha = context.alpha()
+    is_estimating = context.is_estimating()
+    v_matrix = context.repo().token_vectors()
+    v_pred_matrix = context.repo().token_pred_vectors()
+
+    ct_prev = _get_inst_repr(v_matrix, wnd.prev_ins_op().idx, wnd.prev_ins_args_ids(), wnd.prev_repr_buf)
+    ct_next = _get_inst_repr(v_matrix, wnd.next_ins_op().idx, wnd.next_ins_args_ids(), wnd.next_repr_buf)
+    delta = wnd.delta_buf
+    np.add(ct_prev, ct_next, out=delta)
+    delta += f.v
+    delta /= 3
 
     tokens = [wnd.curr_ins_op()] + wnd.curr_ins_args()
 
-    f_grad = np.zeros(f.v.shape)
-    for tk in tokens:
-        # Negative sampling.
-        sampled_tokens: Dict[str, VectorizedToken] = \
-            dict(map(lambda x: (x.name(), x.vectorized()), context.sampler().sample(context.params().neg_samples)))
-        if tk.name() not in sampled_tokens:
-            sampled_tokens[tk.name()] = tk
+    f_grad = wnd.f_grad_buf
+    f_grad.fill(0)
+    for (k, tk) in enumerate(tokens):
+        # Negative sampling: this window's share of the ids drawn in batch by
+        # _train_sequence. The targets are plain row indices now; the positive
+        # token goes first, followed by the distinct negative samples.
+        neg_row = neg_ids[k * neg_samples:(k + 1) * neg_samples]
+        pos_id = tk.idx
+        uniq_neg = np.unique(neg_row)
+        uniq_neg = uniq_neg[uniq_neg != pos_id]
+        target_ids = np.empty(len(uniq_neg) + 1, dtype=np.int64)
+        target_ids[0] = pos_id
+        target_ids[1:] = uniq_neg
+        labels = np.zeros(len(target_ids), dtype=np.float32)
+        labels[0] = 1
 
         # The following code block tries to update the learning rate when necessary. Not required for now.
-        # tokens_handled_counter = context.get_counter(TrainingContext.TOKENS_HANDLED_COUNTER)
-        # if tokens_handled_counter is not None:
-        #     if tokens_handled_counter.val() % context.params().alpha_update_interval == 0:
-        #         # Update the learning rate.
-        #         alpha = 1 - tokens_handled_counter.val() / (
-        #                 context.params().iteration * context.repo().num_of_tokens() + 1)
-        #         context.set_alpha(max(alpha, context.params().initial_alpha * 0.0001))
-
-        for sp_tk in sampled_tokens.values():
-            # Accumulate gradient for function vector.
-            g = (_identity(tk is sp_tk) - _dot_sigmoid(delta, tk.v_pred)) * context.alpha()
-            f_grad += g / 3 * tk.v_pred
-
-            if not context.is_estimating():
-                with context.lock():
-                    # Update v'_t
-                    tk.v_pred -= g * delta
-
-    # Apply function gradient.
-    with context.lock():
-        f.v -= f_grad
-
-    if not context.is_estimating():
+        # if context.tokens_handled % params.alpha_update_interval == 0:
+        #     # Update the learning rate.
+        #     alpha = 1 - context.tokens_handled / (
+        #             params.iteration * context.repo().num_of_tokens() + 1)
+        #     context.set_alpha(max(alpha, params.initial_alpha * 0.0001))
+        # context.tokens_handled += 1
+
+        # One gather, one matrix-vector product and one outer-product scatter
+        # replace the per-target Python loop.
+        v_pred = v_pred_matrix[target_ids]
+        scores = v_pred @ delta
+        g = (labels - kernel.sigmoid(scores)) * alpha
+        f_grad += (g / 3) @ v_pred
+
+        if not is_estimating:
+            # Update v'_t. Like the compiled path, this is an unsynchronized
+            # Hogwild update of the shared matrix.
+            v_pred_matrix[target_ids] -= np.einsum('i,j->ij', g, delta)
+
+    # Apply function gradient. Each function is trained by a single worker, so
+    # f.v is not contended.
+    f.v -= f_grad
+
+    if not is_estimating:
         # Apply gradient to instructions.
         d = len(f_grad) // 2
 
-        with context.lock():
-            wnd.prev_ins_op().v -= f_grad[:d]
-            if len(wnd.prev_ins_args()) > 0:
-                prev_args_grad = f_grad[d:] / len(wnd.prev_ins_args())
-                for t in wnd.prev_ins_args():
-                    t.v -= prev_args_grad
+        args_grad = wnd.args_grad_buf
+        wnd.prev_ins_op().v -= f_grad[:d]
+        if len(wnd.prev_ins_args()) > 0:
+            np.divide(f_grad[d:], len(wnd.prev_ins_args()), out=args_grad)
+            for t in wnd.prev_ins_args():
+                t.v -= args_grad
 
-            wnd.next_ins_op().v -= f_grad[:d]
-            if len(wnd.next_ins_args()) > 0:
-                next_args_grad = f_grad[d:] / len(wnd.next_ins_args())
-                for t in wnd.next_ins_args():
-                    t.v -= next_args_grad
+        wnd.next_ins_op().v -= f_grad[:d]
+        if len(wnd.next_ins_args()) > 0:
+            np.divide(f_grad[d:], len(wnd.next_ins_args()), out=args_grad)
+            for t in wnd.next_ins_args():
+                t.v -= args_grad
 
 
 def _train_sequence(f: VectorizedFunction, seq: List[Instruction], context: TrainingContext) -> None:
     wnd = context.create_sequence_window(seq)
+
+    # Draw the negative samples for the whole sequence in one batch instead of
+    # one sampler call per token.
+    neg_samples = context.params().neg_samples
+    num_of_tokens = sum(1 + len(ins.args()) for ins in seq[1:-1])
+    neg_ids = context.sampler().sample_batch(num_of_tokens * neg_samples)
+
+    if kernel.train_sequence is not None:
+        # Run the whole window loop of this sequence inside the compiled
+        # kernel; the Python path below is the fallback without numba.
+        # The kernel releases the GIL and updates the shared matrices without
+        # synchronization (Hogwild): concurrent sequences mostly touch
+        # disjoint token rows, and occasional lost updates are tolerable for
+        # sparse SGD.
+        repo = context.repo()
+        kernel.train_sequence(f.v, repo.token_vectors(), repo.token_pred_vectors(),
+                              wnd.op_ids(), wnd.args_flat_ids(), wnd.args_offsets(),
+                              neg_ids, neg_samples, context.alpha(), not context.is_estimating())
+        return
+
+    neg_offset = 0
     while wnd.move_next():
-        _train_vectorized(wnd, f, context)
+        wnd_tokens = 1 + len(wnd.curr_ins_args())
+        _train_vectorized(wnd, f, context, neg_ids[neg_offset:neg_offset + wnd_tokens * neg_samples])
+        neg_offset += wnd_tokens * neg_samples
 
 
 def train(repository: FunctionRepository, params: Asm2VecParams) -> None:
     context = TrainingContext(repository, params)
-    context.add_counter(TrainingContext.TOKENS_HANDLED_COUNTER)
 
     asm2vec_logger().debug('Total number of functions: %d', len(context.repo().funcs()))
     progress = Atomic(1)
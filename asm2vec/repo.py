@@ -34,8 +34,35 @@ class VectorizedFunction:
 class VectorizedToken:
     def __init__(self, name: str, v: np.ndarray = None, v_pred: np.ndarray = None, dim: int = 200):
         self._name = name
-        self.v = v if v is not None else np.zeros(dim)
-        self.v_pred = v_pred if v_pred is not None else asm2vec.internal.util.make_small_ndarray(dim * 2)
+        self._dim = dim
+        self._v = v
+        self._v_pred = v_pred
+        self.idx: Optional[int] = None
+
+    # The vectors are allocated lazily: vocabulary construction creates one
+    # VectorizedToken per token occurrence and discards all but the first, so
+    # eager allocation would build (and throw away) an array pair per
+    # occurrence. Once a FunctionRepository adopts the token, these become
+    # views into its row of the shared matrices.
+    @property
+    def v(self) -> np.ndarray:
+        if self._v is None:
+            self._v = np.zeros(self._dim, dtype=np.float32)
+        return self._v
+
+    @v.setter
+    def v(self, value: np.ndarray) -> None:
+        self._v = value
+
+    @property
+    def v_pred(self) -> np.ndarray:
+        if self._v_pred is None:
+            self._v_pred = asm2vec.internal.util.make_small_ndarray(self._dim * 2)
+        return self._v_pred
+
+    @v_pred.setter
+    def v_pred(self, value: np.ndarray) -> None:
+        self._v_pred = value
 
     def __eq__(self, other):
         if not isinstance(other, VectorizedToken):
@@ -69,6 +96,18 @@ class FunctionRepository:
         self._vocab = vocab
         self._num_of_tokens = sum(map(lambda x: x.count, vocab.values()))
 
+        # Pack all token vectors into two contiguous matrices and turn each
+        # VectorizedToken into a view of its own row. Training can then operate
+        # on whole rows of the matrices by index instead of chasing per-token
+        # arrays scattered on the heap.
+        vec_tokens = [t.vectorized() for t in vocab.values()]
+        self._token_vectors = np.array([vt.v for vt in vec_tokens], dtype=np.float32)
+        self._token_pred_vectors = np.array([vt.v_pred for vt in vec_tokens], dtype=np.float32)
+        for (i, vt) in enumerate(vec_tokens):
+            vt.idx = i
+            vt.v = self._token_vectors[i]
+            vt.v_pred = self._token_pred_vectors[i]
+
     def funcs(self) -> List[VectorizedFunction]:
         return self._funcs
 
@@ -78,6 +117,12 @@ class FunctionRepository:
     def num_of_tokens(self) -> int:
         return self._num_of_tokens
 
+    def token_vectors(self) -> np.ndarray:
+        return self._token_vectors
+
+    def token_pred_vectors(self) -> np.ndarray:
+        return self._token_pred_vectors
+
 
 def _serialize_token(token: Token) -> Dict[str, Any]:
     return {
@@ -91,8 +136,8 @@ def _serialize_token(token: Token) -> Dict[str, Any]:
 
 def _deserialize_token(rep: Dict[bytes, Any]) -> Token:
     name = rep[b'name'].decode('utf-8')
-    v = np.array(rep[b'v'])
-    v_pred = np.array(rep[b'v_pred'])
+    v = np.array(rep[b'v'], dtype=np.float32)
+    v_pred = np.array(rep[b'v_pred'], dtype=np.float32)
     count = rep[b'count']
     frequency = rep[b'frequency']
 
@@ -135,7 +180,7 @@ def _serialize_vectorized_function(func: VectorizedFunction, include_sequences:
 def _deserialize_vectorized_function(rep: Dict[bytes, Any]) -> VectorizedFunction:
     name = rep[b'name'].decode('utf-8')
     fid = rep[b'id']
-    v = np.array(rep[b'v'])
+    v = np.array(rep[b'v'], dtype=np.float32)
     sequences = list(map(_deserialize_sequence, rep.get(b'sequences', [])))
     return VectorizedFunction(SequentialFunction(fid, name, sequences), v)
 
@@ -0,0 +1,79 @@
+import unittest as ut
+
+import numpy as np
+
+import asm2vec.asm as asm
+import asm2vec.internal.kernel as kernel
+import asm2vec.internal.repr
+import asm2vec.internal.training as training
+
+
+test_code = [
+    'push rbp',
+    'mov rbp, rsp',
+    'mov eax, ebx',
+    'add eax, 1',
+    'xor ebx, ebx',
+    'ret'
+]
+
+
+def _make_test_repo():
+    block = asm.BasicBlock()
+    for code in test_code:
+        block.add_instruction(asm.parse_instruction(code))
+    func = asm.Function(block, 'test_func')
+    return asm2vec.internal.repr.make_function_repo([func], 8, 1, 1)
+
+
+@ut.skipIf(kernel.train_sequence is None, 'numba is not available')
+class TrainingPathEquivalenceTest(ut.TestCase):
+    def setUp(self):
+        self._repo = _make_test_repo()
+        self._v0 = self._repo.token_vectors().copy()
+        self._v_pred0 = self._repo.token_pred_vectors().copy()
+        self._f_v0 = self._repo.funcs()[0].v.copy()
+        self._params = training.Asm2VecParams(d=8, neg_samples=5)
+
+    def _run_path(self, use_kernel: bool, is_estimating: bool):
+        self._repo.token_vectors()[:] = self._v0
+        self._repo.token_pred_vectors()[:] = self._v_pred0
+        f = self._repo.funcs()[0]
+        f.v[:] = self._f_v0
+
+        context = training.TrainingContext(self._repo, self._params, is_estimating)
+        seq = f.sequential().sequences()[0]
+
+        saved = kernel.train_sequence
+        if not use_kernel:
+            kernel.train_sequence = None
+        try:
+            # Both runs seed the global RNG so they draw identical neg_ids.
+            np.random.seed(12345)
+            training._train_sequence(f, seq, context)
+        finally:
+            kernel.train_sequence = saved
+
+        return f.v.copy(), self._repo.token_vectors().copy(), self._repo.token_pred_vectors().copy()
+
+    def _assert_paths_agree(self, is_estimating: bool):
+        f_v_k, v_k, v_pred_k = self._run_path(True, is_estimating)
+        f_v_p, v_p, v_pred_p = self._run_path(False, is_estimating)
+
+        # The tolerance covers the sigmoid-table quantization in the compiled
+        # kernel; the fallback uses the exact sigmoid.
+        tolerance = 1e-3
+        self.assertTrue(np.allclose(f_v_k, f_v_p, atol=tolerance), 'Function vectors diverged')
+        self.assertTrue(np.allclose(v_k, v_p, atol=tolerance), 'Token vectors diverged')
+        self.assertTrue(np.allclose(v_pred_k, v_pred_p, atol=tolerance), 'Token prediction vectors diverged')
+
+        if is_estimating:
+            self.assertTrue(np.array_equal(v_k, self._v0), 'Estimation must not update token vectors')
+            self.assertTrue(np.array_equal(v_pred_k, self._v_pred0),
+                            'Estimation must not update token prediction vectors')
+
+    def test_training_paths_agree(self):
+        self._assert_paths_agree(False)
+
+    def test_estimating_paths_agree(self):
+        self._assert_paths_agree(True)